@@ -0,0 +1,36 @@
+import json
+import platform
+import statistics
+from typing import Any, Dict, List, Optional
+
+from mrstream.version import __version__
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return {"p50": value, "p99": value, "mean": value, "max": value}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50": statistics.median(samples),
+        "p99": cuts[98],
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+    }
+
+
+def report(name: str, params: Dict[str, Any], results: Dict[str, Any], output: Optional[str]) -> None:
+    # Results are tagged with the mrstream and Python versions so runs can be compared over time
+    data = {
+        "benchmark": name,
+        "mrstream": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    text = json.dumps(data, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
@@ -0,0 +1,181 @@
+"""
+Benchmark for the EventSub websocket bridge.
+
+Registers the bridge's event handlers against a fake Twitch client, attaches
+N websocket clients to eventsub_handler over loopback, then fires a mix of
+raid, follow and chat-with-emote events and times their delivery.
+
+As with twitchAPI, the event callbacks run on a separate thread with its own
+event loop, so the times include handing each event over to the bridge's loop.
+With --rate 0 the whole run arrives as one burst, which overflows the client
+queues and gets every client disconnected by design.
+
+    python benchmarks/eventsub.py [--clients 50] [--events 300] [--rate 200] [--output results.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+from functools import partial
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from websockets import client as websocket_client
+from websockets import server as websocket_server
+
+from common import percentiles, report
+from mrstream import twitch
+
+EMOTE_SET_ID = "bench_set"
+EMOTE_ID = "bench_emote"
+
+
+class FakeTwitch:
+    # Just enough of twitchAPI.twitch.Twitch for the bridge's handlers
+    async def get_emote_sets(self, set_ids: List[str]) -> Any:
+        return SimpleNamespace(
+            template="https://static-cdn.jtvnw.net/emoticons/v2/{{id}}/{{format}}/{{theme_mode}}/{{scale}}",
+            data=[SimpleNamespace(id=EMOTE_ID, name="benchHype", format=["static"], theme_mode=["dark"], scale=["1.0", "3.0"])],
+        )
+
+    async def send_chat_message(self, broadcaster_id: str, sender_id: str, message: str, reply_id: Optional[str] = None) -> None:
+        pass
+
+
+class FakeEventSub:
+    # Captures the callbacks instead of subscribing to Twitch
+    def __init__(self) -> None:
+        self.callbacks: Dict[str, Callable[[Any], Awaitable[None]]] = {}
+
+    async def listen_channel_follow_v2(self, broadcaster_user_id: str, moderator_user_id: str, callback: Callable[[Any], Awaitable[None]]) -> None:
+        self.callbacks["follow"] = callback
+
+    async def listen_channel_raid(self, callback: Callable[[Any], Awaitable[None]], to_broadcaster_user_id: Optional[str], from_broadcaster_user_id: Optional[str]) -> None:
+        self.callbacks["raid"] = callback
+
+    async def listen_channel_chat_message(self, broadcaster_user_id: str, user_id: str, callback: Callable[[Any], Awaitable[None]]) -> None:
+        self.callbacks["chat"] = callback
+
+
+def make_event(kind: str, seq: int) -> Any:
+    # The username carries the sequence number, so clients can match what they receive to when it was sent
+    username = f"u{seq}"
+    if kind == "raid":
+        return SimpleNamespace(event=SimpleNamespace(from_broadcaster_user_name=username, viewers=seq))
+    if kind == "follow":
+        return SimpleNamespace(event=SimpleNamespace(user_name=username))
+    emote = SimpleNamespace(emote_set_id=EMOTE_SET_ID, id=EMOTE_ID, owner_id="0")
+    return SimpleNamespace(event=SimpleNamespace(
+        message_id=f"m{seq}",
+        chatter_user_name=username,
+        message=SimpleNamespace(
+            text="hello benchHype",
+            fragments=[SimpleNamespace(type="text", emote=None), SimpleNamespace(type="emote", emote=emote)],
+        ),
+    ))
+
+
+async def run(clients: int, events: int, rate: float, timeout: float) -> Dict[str, Any]:
+    eventsub = FakeEventSub()
+    client_response = await twitch.listen_eventsub(FakeTwitch(), eventsub, "0")  # type: ignore
+
+    kinds = ["raid", "follow", "chat"]
+    schedule = [kinds[i % len(kinds)] for i in range(events)]
+    # chat messages with an emote go out as two payloads
+    expected = sum(2 if k == "chat" else 1 for k in schedule)
+
+    sent: Dict[int, int] = {}
+    latencies: List[float] = []
+    finished: List[asyncio.Event] = []
+
+    async def receive(ws: websocket_client.WebSocketClientProtocol, done: asyncio.Event) -> None:
+        count = 0
+        async for message in ws:
+            now = time.perf_counter_ns()
+            seq = int(json.loads(message)["username"][1:])
+            latencies.append((now - sent[seq]) / 1e6)
+            count += 1
+            if count == expected:
+                done.set()
+                return
+
+    async with websocket_server.serve(partial(twitch.eventsub_handler, client_response), "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+
+        # Clients run in this process too, so this counts both ends of each connection
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        connections = [await websocket_client.connect(f"ws://127.0.0.1:{port}") for _ in range(clients)]
+        while len(twitch.EVENT_BUS) < clients:
+            await asyncio.sleep(0.01)
+        memory_per_client = (tracemalloc.get_traced_memory()[0] - before) / clients
+        tracemalloc.stop()
+
+        tasks = []
+        for ws in connections:
+            done = asyncio.Event()
+            finished.append(done)
+            tasks.append(asyncio.create_task(receive(ws, done)))
+
+        # Stands in for twitchAPI's socket thread
+        callback_loop = asyncio.new_event_loop()
+        callback_thread = threading.Thread(target=callback_loop.run_forever, daemon=True)
+        callback_thread.start()
+
+        async def fire() -> None:
+            for seq, kind in enumerate(schedule):
+                sent[seq] = time.perf_counter_ns()
+                await eventsub.callbacks[kind](make_event(kind, seq))
+                # Real events each arrive off the EventSub socket, so let the loop run in between
+                await asyncio.sleep(1 / rate if rate else 0)
+
+        # The bridge's loop isn't woken by anything here until every event has
+        # been fired, so a handover that doesn't wake it shows up as a stall
+        start = time.perf_counter_ns()
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(fire(), callback_loop))
+        try:
+            await asyncio.wait_for(asyncio.gather(*(d.wait() for d in finished)), timeout)
+        except asyncio.TimeoutError:
+            pass
+        elapsed = (time.perf_counter_ns() - start) / 1e9
+
+        callback_loop.call_soon_threadsafe(callback_loop.stop)
+        callback_thread.join()
+        callback_loop.close()
+        for task in tasks:
+            task.cancel()
+        for ws in connections:
+            await ws.close()
+
+    return {
+        "deliveries": len(latencies),
+        "expected_deliveries": expected * clients,
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": percentiles(latencies),
+        "memory_per_client_bytes": memory_per_client,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the EventSub websocket bridge")
+    parser.add_argument("--clients", type=int, default=50, help="Number of websocket clients to attach")
+    parser.add_argument("--events", type=int, default=300, help="Number of synthetic events to send")
+    parser.add_argument("--rate", type=float, default=200, help="Events per second to send at (0 for as fast as possible)")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for all events to be delivered")
+    parser.add_argument("--output", help="Also write the JSON results to this path")
+    args = parser.parse_args()
+
+    # The bridge logs every event and connection to stdout; keep that out of the results
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = asyncio.run(run(args.clients, args.events, args.rate, args.timeout))
+    params = {"clients": args.clients, "events": args.events, "rate": args.rate}
+    report("eventsub", params, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
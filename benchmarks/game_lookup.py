@@ -0,0 +1,86 @@
+"""
+Micro-benchmarks for the local game list search.
+
+Generates a game list CSV in the same layout as the upstream one, points
+game_lookup at it, then times the initial load and repeated search_local calls.
+
+    python benchmarks/game_lookup.py [--rows 100000] [--repeat 3] [--output results.json]
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from common import percentiles, report
+from mrstream import game_lookup
+
+WORDS = [
+    "Super", "Mega", "Dark", "Legend", "Quest", "Star", "Dragon", "Knight", "Space", "Racing",
+    "Tactics", "Fantasy", "Chronicles", "Shadow", "Island", "Castle", "Galaxy", "Soul", "Rogue", "Tower",
+    "Ninja", "Pirate", "Robot", "Zombie", "Kingdom", "Empire", "Hero", "Storm", "Crystal", "Ocean",
+]
+
+QUERIES = ["Dragon Quest", "super mega knight", "Star Tactics IV", "zombi castel", "Chronicles of the Dark Tower"]
+
+
+def generate_list(path: str, rows: int, seed: int) -> None:
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "name", "box_art_url"])
+        for i in range(rows):
+            name = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+            # suffix keeps names unique, like sequels in the real list
+            name = f"{name} {i}" if rng.random() < 0.5 else f"{name} {rng.choice(['II', 'III', 'IV', 'HD', 'Remastered'])} {i}"
+            writer.writerow([str(100000 + i), name, f"https://static-cdn.jtvnw.net/ttv-boxart/{100000 + i}.jpg"])
+
+
+def run(rows: int, repeat: int, seed: int) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "twitch_game_info.csv")
+        generate_list(path, rows, seed)
+        game_lookup.TWITCH_GAME_LIST_PATH = path
+        game_lookup._TWITCH_GAME_NAME_TO_ID.clear()
+        game_lookup._TWITCH_GAME_NAMES.clear()
+
+        start = time.perf_counter_ns()
+        game_lookup.load_local()
+        load_ms = (time.perf_counter_ns() - start) / 1e6
+
+        per_query: Dict[str, Dict[str, float]] = {}
+        samples: List[float] = []
+        for query in QUERIES:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter_ns()
+                game_lookup.search_local(query)
+                timings.append((time.perf_counter_ns() - start) / 1e6)
+            per_query[query] = percentiles(timings)
+            samples.extend(timings)
+
+    return {
+        "games": len(game_lookup._TWITCH_GAME_NAMES),
+        "load_ms": load_ms,
+        "search_ms": percentiles(samples),
+        "search_ms_by_query": per_query,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the local game list search")
+    parser.add_argument("--rows", type=int, default=100000, help="Number of games in the generated list")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times to run each query")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for generating game names")
+    parser.add_argument("--output", help="Also write the JSON results to this path")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.repeat, args.seed)
+    params = {"rows": args.rows, "repeat": args.repeat, "seed": args.seed, "queries": QUERIES}
+    report("game_lookup", params, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
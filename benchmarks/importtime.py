@@ -0,0 +1,89 @@
+"""
+Import-time budget for config-only commands.
+
+Runs each command under "python -X importtime" against a throwaway config
+directory, then fails if it imports any of the network backends or spends
+longer than the budget importing modules.
+
+    python benchmarks/importtime.py [--budget-ms 50]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+# Modules that only the network commands should ever load
+FORBIDDEN = ["twitchAPI", "aiohttp", "websockets", "thefuzz", "requests"]
+
+# Run in order, as later commands need the service added by the first one
+COMMANDS: List[Tuple[str, List[str]]] = [
+    ("add twitch", ["add", "twitch", "bench", "client_id", "client_secret"]),
+    ("add peertube", ["add", "peertube", "bench_pt", "https://example.com", "user", "pass"]),
+    ("add rtmp", ["add", "rtmp", "bench_rtmp", "rtmp://localhost/live", "key"]),
+    ("disable", ["disable", "bench"]),
+    ("enable", ["enable", "bench"]),
+]
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    # Returns module -> self time in microseconds, for everything imported
+    # after interpreter startup (i.e. after the top-level "site" entry)
+    modules: Dict[str, int] = {}
+    started = False
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        if not started:
+            if name == "site":
+                started = True
+            continue
+        modules[name] = int(fields[0])
+    return modules
+
+
+def run_command(argv: List[str], env: Dict[str, str]) -> Dict[str, int]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "from mrstream.cli import main; main()", "--no-daemon", *argv],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Command {argv} failed:\n{result.stderr}")
+    return parse_importtime(result.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check import time of config-only mrstream commands")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="Maximum time spent importing modules per command")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env["XDG_CONFIG_HOME"] = tmp
+        print(f"{'command':<16} {'modules':>8} {'import ms':>10}  result")
+        for label, argv in COMMANDS:
+            modules = run_command(argv, env)
+            total_ms = sum(modules.values()) / 1000
+            problems = []
+            bad = sorted({m.split(".")[0] for m in modules if m.split(".")[0] in FORBIDDEN})
+            if bad:
+                problems.append(f"imports {', '.join(bad)}")
+            if total_ms > args.budget_ms:
+                problems.append(f"over budget of {args.budget_ms:.1f}ms")
+            failed = failed or bool(problems)
+            print(f"{label:<16} {len(modules):>8} {total_ms:>10.1f}  {'; '.join(problems) or 'ok'}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,12 @@
 import argparse
-import asyncio
+import datetime
+import json
 import pathlib
 
 
-from . import config, twitch, peertube
-from .game_lookup import search
-from .nginx import run_server
-from .website import update_website
+# Backend modules pull in twitchAPI, aiohttp, thefuzz and requests, so they're
+# imported by the commands that use them rather than here.
+from . import config, daemon, services, timing
 
 def add_twitch(args: argparse.Namespace) -> None:
     cfg = config.get()
@@ -37,39 +37,46 @@ def add_peertube(args: argparse.Namespace) -> None:
     print(f"Added \"{args.NAME}\" as a PeerTube service")
 
 
-def create(args: argparse.Namespace):
+def add_rtmp(args: argparse.Namespace) -> None:
     cfg = config.get()
-    for key in cfg.keys():
-        if key.startswith("config."):
-            svc_name = key[7:]
-            if cfg[key]["enabled"] != "1":
-                continue
-            print(f"Creating stream on {svc_name}...")
-            if cfg[key]["type"] == "twitch":
-                asyncio.run(twitch.create_stream(
-                    svc_name,
-                    title=args.title,
-                    description=args.description,
-                    announcement=args.announcement,
-                    game=args.game,
-                    gameid=args.gameid,
-                    lang=args.lang,
-                    vod=args.vod
-                ))
-            elif cfg[key]["type"] == "peertube":
-                peertube.create_stream(
-                    svc_name,
-                    title=args.title,
-                    description=args.description,
-                    announcement=args.announcement,
-                    game=args.game,
-                    gameid=args.gameid,
-                    lang=args.lang,
-                    vod=args.vod
-                ) 
+    name = f"config.{args.NAME}"
+    if name in cfg:
+        raise ValueError(f"There's already a service named \"{args.NAME}\"")
+    cfg[name] = {}
+    cfg[name]["type"] = "rtmp"
+    cfg[name]["url"] = args.URL
+    if args.STREAM_KEY:
+        cfg[name]["stream_key"] = args.STREAM_KEY
+    cfg[name]["enabled"] = "1"
+    config.set(cfg)
+    print(f"Added \"{args.NAME}\" as an RTMP service")
+
+
+def create(args: argparse.Namespace):
+    for svc in services.get().enabled:
+        print(f"Creating stream on {svc.name}...")
+        svc.create(
+            title=args.title,
+            description=args.description,
+            announcement=args.announcement,
+            game=args.game,
+            gameid=args.gameid,
+            lang=args.lang,
+            vod=args.vod
+        )
 
 def update(args: argparse.Namespace):
-    cfg = config.get()
+    for svc in services.get().enabled:
+        print(f"Updating stream on {svc.name}...")
+        svc.update(
+            title=args.title,
+            description=args.description,
+            announcement=args.announcement,
+            game=args.game,
+            gameid=args.gameid,
+            lang=args.lang,
+            vod=args.vod
+        )
 
 
 def set_defaults(args: argparse.Namespace):
@@ -107,48 +114,89 @@ def set_defaults(args: argparse.Namespace):
 
 
 def enable(args: argparse.Namespace) -> None:
-    cfg = config.get()
-    name = f"config.{args.NAME}"
-    if name not in cfg:
+    if args.NAME not in services.get().services:
         raise ValueError(f"No service named \"{args.NAME}\"")
-    cfg[name]["enabled"] = "1"
+    cfg = config.get()
+    cfg[f"config.{args.NAME}"]["enabled"] = "1"
     config.set(cfg)
 
 
 def disable(args: argparse.Namespace) -> None:
-    cfg = config.get()
-    name = f"config.{args.NAME}"
-    if name not in cfg:
+    if args.NAME not in services.get().services:
         raise ValueError(f"No service named \"{args.NAME}\"")
-    cfg[name]["enabled"] = "0"
+    cfg = config.get()
+    cfg[f"config.{args.NAME}"]["enabled"] = "0"
     config.set(cfg)
 
 
 def game_lookup(args: argparse.Namespace) -> None:
+    from .game_lookup import search
+
     results = search(args.NAME)
     for r in results:
         print(f"{r.name} (id {r.game_id}, confidence {r.confidence})")
 
 
 def website(args: argparse.Namespace) -> None:
+    from .website import update_website
+
     update_website(args.BASE_PATH)
 
 
 def runserver(args: argparse.Namespace) -> None:
+    from .nginx import run_server
+
     run_server()
 
 def runevents(args: argparse.Namespace) -> None:
-    cfg = config.get()
-    for k in cfg.keys():
-        if k.startswith("config.") and cfg[k]["type"] == "twitch":
-            svc_name = k[7:]
-            asyncio.run(twitch.run_eventsub_server(svc_name, args.port))
+    import asyncio
+    from . import twitch
+
+    for svc in services.get().of_type("twitch"):
+        # asyncio.run cancels the server on Ctrl-C and waits for it to wind down,
+        # so the journal gets closed and flushed
+        asyncio.run(twitch.run_eventsub_server(svc.name, args.port, args.workers, args.journal))
+
+
+def worker_count(value: str) -> int:
+    count = int(value)
+    if count < 0:
+        raise argparse.ArgumentTypeError("must be 0 or more")
+    return count
+
+
+def timestamp(value: str) -> float:
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def events_query(args: argparse.Namespace) -> None:
+    from . import journal
+
+    for record in journal.query(args.since, args.until, args.type):
+        print(json.dumps(record))
+
+
+def rundaemon(args: argparse.Namespace) -> None:
+    daemon.serve()
+
+
+# Commands that can be handed off to "mrstream daemon" if it's running
+DAEMON_COMMANDS = {
+    "create": create,
+    "update": update,
+    "game_lookup": game_lookup,
+    "enable": enable,
+    "disable": disable,
+    "website": website,
+}
 
 
 def main():
     parser = argparse.ArgumentParser(
         description="Manage streaming across multiple services",
     )
+    parser.add_argument("--no-daemon", dest="use_daemon", action="store_false", help="Run the command here, even if a daemon is running")
+    parser.add_argument("--profile", metavar="PATH", help="Time each network call, write a Chrome trace to PATH and print a summary")
     subparser = parser.add_subparsers()
 
     parser_add = subparser.add_parser("add", description="Add a streaming service")
@@ -165,6 +213,12 @@ def main():
     parser_add_peertube.add_argument("USERNAME", help="Account username")
     parser_add_peertube.add_argument("PASSWORD", help="Account password")
     parser_add_peertube.set_defaults(func=add_peertube)
+
+    parser_add_rtmp = parser_add_subs.add_parser("rtmp", description="Add a plain RTMP destination")
+    parser_add_rtmp.add_argument("NAME", help="Local name for service")
+    parser_add_rtmp.add_argument("URL", help="RTMP URL to push to")
+    parser_add_rtmp.add_argument("STREAM_KEY", nargs="?", help="Stream key, if it's not already part of the URL")
+    parser_add_rtmp.set_defaults(func=add_rtmp)
     
     parser_enable = subparser.add_parser("enable", description="Enable a streaming account")
     parser_enable.add_argument("NAME", help="Local name for service")
@@ -203,8 +257,21 @@ def main():
 
     parser_runevents = subparser.add_parser("runevents", description="Run an Websocket bridge for Twitch events")
     parser_runevents.add_argument("--port", help="Port to use", type=int, default=26661)
+    parser_runevents.add_argument("--workers", help="Number of processes to share the websocket clients between (0 to handle them in this process)", type=worker_count, default=0)
+    parser_runevents.add_argument("--no-journal", dest="journal", action="store_false", help="Don't record events to the journal")
     parser_runevents.set_defaults(func=runevents)
 
+    parser_events = subparser.add_parser("events", description="Look through events recorded by runevents")
+    parser_events_subs = parser_events.add_subparsers()
+    parser_events_query = parser_events_subs.add_parser("query", description="Print recorded events as JSON lines")
+    parser_events_query.add_argument("--since", help="Earliest time to include, in ISO 8601 format", type=timestamp)
+    parser_events_query.add_argument("--until", help="Latest time to include, in ISO 8601 format", type=timestamp)
+    parser_events_query.add_argument("--type", help="Event type to include (raid, follow, message or emote); can be given more than once", action="append")
+    parser_events_query.set_defaults(func=events_query)
+
+    parser_daemon = subparser.add_parser("daemon", description="Run a background server that keeps clients warm for other commands")
+    parser_daemon.set_defaults(func=rundaemon)
+
     parser_website = subparser.add_parser("website", description="Generate Pelican posts for Twitch highlights")
     parser_website.add_argument("BASE_PATH", help="Content folder to output to", type=pathlib.Path)
     parser_website.set_defaults(func=website)
@@ -225,7 +292,17 @@ def main():
         parser.print_help()
         exit(1)
 
-    args.func(args)
+    if args.profile:
+        timing.enable()
+    try:
+        command = args.func.__name__
+        if args.use_daemon and command in DAEMON_COMMANDS and daemon.forward(command, args):
+            return
+        args.func(args)
+    finally:
+        if args.profile:
+            timing.dump(args.profile)
+            timing.print_summary()
 
 
 if __name__ == "__main__":
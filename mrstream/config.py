@@ -1,19 +1,61 @@
 import configparser
+import io
 import os
+from typing import Optional, Tuple
 
 import appdirs
 
+from . import timing
+
 LOCAL_CONFIG_DIR: str = appdirs.user_config_dir("mrstream")
 LOCAL_CONFIG_PATH: str = os.path.join(LOCAL_CONFIG_DIR, "mrstream.ini")
 LOCAL_NGINX_PATH: str = os.path.join(LOCAL_CONFIG_DIR, "nginx.conf")
+LOCAL_DAEMON_PATH: str = os.path.join(LOCAL_CONFIG_DIR, "mrstream.sock")
+
+# (mtime, size) of the config file, and its contents.
+# Long-running processes like the daemon re-read from here instead of the disk.
+_CACHE: Optional[Tuple[Tuple[int, int], str]] = None
+# Bumped whenever the contents change, for caches built on top of the config
+_GENERATION: int = 0
+
+
+def signature() -> Tuple[int, int]:
+    try:
+        st = os.stat(LOCAL_CONFIG_PATH)
+    except FileNotFoundError:
+        return (0, 0)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _load() -> str:
+    global _CACHE, _GENERATION
+    sig = signature()
+    if _CACHE is None or _CACHE[0] != sig:
+        text = ""
+        if os.path.exists(LOCAL_CONFIG_PATH):
+            with timing.span("config.read"), open(LOCAL_CONFIG_PATH, "r") as file:
+                text = file.read()
+        _CACHE = (sig, text)
+        _GENERATION += 1
+    return _CACHE[1]
+
+
+def generation() -> int:
+    _load()
+    return _GENERATION
 
 
 def get() -> configparser.ConfigParser:
     config = configparser.ConfigParser()
-    config.read(LOCAL_CONFIG_PATH)
+    config.read_string(_load(), source=LOCAL_CONFIG_PATH)
     return config
 
 def set(config: configparser.ConfigParser):
+    global _CACHE, _GENERATION
     os.makedirs(LOCAL_CONFIG_DIR, exist_ok=True)
-    with open(LOCAL_CONFIG_PATH, "w") as file:
-        config.write(file)
+    buffer = io.StringIO()
+    config.write(buffer)
+    with timing.span("config.write"), open(LOCAL_CONFIG_PATH, "w") as file:
+        file.write(buffer.getvalue())
+    _CACHE = (signature(), buffer.getvalue())
+    _GENERATION += 1
@@ -0,0 +1,157 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import pathlib
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import traceback
+from typing import Callable, Dict, Optional
+
+from . import config, timing
+
+# Commands the daemon will run on behalf of the CLI.
+# Filled in by serve(), as importing cli from here would be circular.
+_COMMANDS: Dict[str, Callable[[argparse.Namespace], None]] = {}
+_SERVER: Optional[socketserver.UnixStreamServer] = None
+
+# Seconds to wait for the daemon to accept a connection, and to finish a command.
+# Commands that log in to a service can sit on a browser prompt, so allow a while.
+CONNECT_TIMEOUT = 2.0
+RESPONSE_TIMEOUT = 300.0
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # One JSON request per line in, one JSON response per line out.
+    # Requests are handled one at a time, so redirecting stdout is safe.
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            return
+        request = json.loads(line)
+        func = _COMMANDS.get(request.pop("command", None))
+        if request.get("profile"):
+            timing.enable()
+        output = io.StringIO()
+        response = {}
+        if func is None:
+            response["error"] = "Unknown command"
+        else:
+            try:
+                with contextlib.redirect_stdout(output):
+                    func(argparse.Namespace(**request))
+            except Exception as e:
+                traceback.print_exc()
+                response["error"] = f"{type(e).__name__}: {e}"
+        timing.disable()
+        response["output"] = output.getvalue()
+        response["trace"] = timing.collect()
+        self.wfile.write(json.dumps(response).encode("utf8") + b"\n")
+
+
+def forward(
+    command: str,
+    args: argparse.Namespace,
+    path: str = config.LOCAL_DAEMON_PATH,
+    timeout: float = RESPONSE_TIMEOUT,
+) -> bool:
+    # Returns False if there's no daemon listening, so the caller can run the command itself
+    if not os.path.exists(path):
+        return False
+
+    request = {"command": command}
+    for k, v in vars(args).items():
+        if callable(v):
+            continue
+        if isinstance(v, pathlib.Path):
+            # the daemon doesn't share our working directory
+            v = str(v.resolve())
+        request[k] = v
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(path)
+    except (FileNotFoundError, ConnectionRefusedError, socket.timeout):
+        sock.close()
+        return False
+
+    sock.settimeout(timeout)
+    try:
+        with timing.span("daemon.forward", command=command), sock, sock.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode("utf8") + b"\n")
+            stream.flush()
+            line = stream.readline()
+    except socket.timeout:
+        raise RuntimeError(
+            f"Daemon didn't finish \"{command}\" within {timeout:.0f} seconds; "
+            "check on it, or run with --no-daemon"
+        )
+    if not line:
+        raise RuntimeError("Daemon closed the connection without responding")
+    response = json.loads(line)
+    timing.extend(response.get("trace", []))
+    print(response.get("output", ""), end="")
+    if "error" in response:
+        raise RuntimeError(f"Daemon: {response['error']}")
+    return True
+
+
+def serve(path: str = config.LOCAL_DAEMON_PATH) -> None:
+    from . import cli, game_lookup, services
+
+    _COMMANDS.update(cli.DAEMON_COMMANDS)
+
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            raise RuntimeError(f"A daemon is already running on {path}")
+        except ConnectionRefusedError:
+            # left over from a daemon that didn't exit cleanly
+            os.unlink(path)
+        finally:
+            probe.close()
+
+    # Warm everything up front so the first command is as fast as the rest
+    if os.path.exists(game_lookup.TWITCH_GAME_LIST_PATH):
+        game_lookup.load_local()
+    for svc in services.get().services.values():
+        try:
+            svc.authenticate()
+        except Exception as e:
+            # the command will try again, and report it properly
+            print(f"Couldn't log in to \"{svc.name}\" ahead of time: {e}", file=sys.stderr)
+
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    # Anyone who can connect can run commands with our credentials,
+    # so the socket must be owner-only from the moment it exists
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(path, _Handler)
+    finally:
+        os.umask(umask)
+
+    global _SERVER
+    _SERVER = server
+    with server:
+        print(f"Daemon listening on {path}")
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            _SERVER = None
+            os.unlink(path)
+
+
+def stop() -> None:
+    # Stops a serve() running on another thread
+    if _SERVER is not None:
+        _SERVER.shutdown()
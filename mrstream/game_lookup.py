@@ -2,11 +2,10 @@ from typing import Dict, List, NamedTuple, Optional
 import requests
 from thefuzz import process
 
-import asyncio
 import csv
 import os
 
-from . import config, twitch
+from . import config, services, timing, twitch
 
 TWITCH_GAME_LIST_SOURCE = "https://raw.githubusercontent.com/Nerothos/TwithGameList/master/game_info.csv"
 TWITCH_GAME_LIST_PATH = os.path.join(config.LOCAL_CONFIG_DIR, "twitch_game_info.csv")
@@ -41,31 +40,33 @@ def search(name: str) -> List[GameResult]:
     return result
 
 def search_twitch(name: str) -> List[GameResult]:
-    cfg = config.get()
-    for k in cfg.keys():
-        if k.startswith("config.") and cfg[k]["type"] == "twitch":
-            svc_name = k[7:]
-            results = asyncio.run(twitch.search_games(svc_name, name))
-            return [GameResult(name=x.name, game_id=x.id, confidence=None) for x in results]
+    for svc in services.get().of_type("twitch"):
+        results = twitch.run_sync(twitch.search_games(svc.name, name))
+        return [GameResult(name=x.name, game_id=x.id, confidence=None) for x in results]
     return []
 
 
-def search_local(name: str) -> List[GameResult]:
+def load_local() -> None:
     # get the game list
     if not os.path.exists(TWITCH_GAME_LIST_PATH):
-        twitch_list = requests.get(TWITCH_GAME_LIST_SOURCE)
+        with timing.span("game_lookup.download_list"):
+            twitch_list = requests.get(TWITCH_GAME_LIST_SOURCE)
         twitch_list.raise_for_status()
         with open(TWITCH_GAME_LIST_PATH, "wb") as output:
             output.write(twitch_list.content)
     
     if len(_TWITCH_GAME_NAME_TO_ID) == 0:
-        with open(TWITCH_GAME_LIST_PATH, "r") as listfile:
+        with timing.span("game_lookup.load_list"), open(TWITCH_GAME_LIST_PATH, "r") as listfile:
             c = csv.reader(listfile)
             next(c)
             for row in c:
                 if len(row) > 2:
                     _TWITCH_GAME_NAME_TO_ID[row[1]] = row[0]
         _TWITCH_GAME_NAMES.extend(_TWITCH_GAME_NAME_TO_ID.keys())
-    
-    results = process.extract(name, _TWITCH_GAME_NAMES)
+
+
+def search_local(name: str) -> List[GameResult]:
+    load_local()
+    with timing.span("game_lookup.search_local"):
+        results = process.extract(name, _TWITCH_GAME_NAMES)
     return [GameResult(name=x[0], game_id=_TWITCH_GAME_NAME_TO_ID[x[0]], confidence=x[1]) for x in results]
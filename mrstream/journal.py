@@ -0,0 +1,289 @@
+import atexit
+import collections
+import fcntl
+import glob
+import gzip
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from typing import IO, Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import config, timing
+
+LOCAL_JOURNAL_DIR: str = os.path.join(config.LOCAL_CONFIG_DIR, "events")
+
+SEGMENT_MAX_BYTES = 16 * 1024 * 1024
+SEGMENT_MAX_AGE = 60 * 60
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH = 256
+# Events held in memory while the disk is failing, before the oldest are dropped
+MAX_PENDING = 100000
+
+
+# Each segment is a file of JSON lines, one event per line with its timestamp as "ts".
+# Alongside it is a small index with the time range and event types it covers,
+# so queries only open the segments they need.
+#
+#   events-<start ms>.jsonl       segment being written
+#   events-<start ms>.jsonl.gz    finished segment
+#   events-<start ms>.idx.json    index for either
+
+def _index_path(segment: str) -> str:
+    return segment[:-len(".jsonl")] + ".idx.json"
+
+
+def _write_index(segment: str, index: Dict[str, Any]) -> None:
+    path = _index_path(segment)
+    with open(path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(path + ".tmp", path)
+
+
+def _update_index(index: Dict[str, Any], record: Dict[str, Any]) -> None:
+    index["start"] = min(index.get("start", record["ts"]), record["ts"])
+    index["end"] = max(index.get("end", record["ts"]), record["ts"])
+    index["count"] = index.get("count", 0) + 1
+    types = index.setdefault("types", {})
+    types[record.get("type")] = types.get(record.get("type"), 0) + 1
+
+
+def _read_segment(segment: str) -> Iterator[Dict[str, Any]]:
+    # Prefer the uncompressed file; it's only removed once the .gz is complete
+    try:
+        f = open(segment, "r")
+    except FileNotFoundError:
+        f = gzip.open(segment + ".gz", "rt")
+    with f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # the writer may be partway through this line
+                continue
+
+
+def _lock(f: IO[str]) -> bool:
+    # Claims the segment open as f for as long as f stays open. Fails if another
+    # journal has it, or it has been finished off and removed since f was opened.
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    try:
+        return os.path.samestat(os.fstat(f.fileno()), os.stat(f.name))
+    except FileNotFoundError:
+        return False
+
+
+def _compress(segment: str) -> None:
+    with timing.span("journal.compress"):
+        with open(segment, "rb") as src, gzip.open(segment + ".gz.tmp", "wb") as dest:
+            shutil.copyfileobj(src, dest)
+        os.replace(segment + ".gz.tmp", segment + ".gz")
+        os.unlink(segment)
+
+
+class Journal:
+    # Appends events to the current segment from a background thread.
+    # append() only adds to a list, so event dispatch never waits on the disk;
+    # the thread writes everything that has built up in one go, every
+    # FLUSH_INTERVAL seconds or once FLUSH_BATCH events are waiting.
+
+    def __init__(self, path: str = LOCAL_JOURNAL_DIR) -> None:
+        self.path = path
+        self._pending: Deque[Dict[str, Any]] = collections.deque(maxlen=MAX_PENDING)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._segment: Optional[str] = None
+        self._file = None
+        self._opened_at = 0.0
+        self._index: Dict[str, Any] = {}
+        self._failing = False
+        self._dropped = 0
+
+        os.makedirs(path, exist_ok=True)
+        # Finish off segments left by a previous run. The index is always rebuilt,
+        # as the run may have stopped between writing a batch and updating it.
+        # Segments still locked belong to another journal that's running.
+        for segment in glob.glob(os.path.join(path, "events-*.jsonl")):
+            try:
+                f = open(segment, "r")
+            except FileNotFoundError:
+                continue
+            with f:
+                if not _lock(f):
+                    continue
+                index: Dict[str, Any] = {}
+                for record in _read_segment(segment):
+                    _update_index(index, record)
+                _write_index(segment, index)
+                _compress(segment)
+
+        self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+        self._thread.start()
+        # The thread is a daemon so it can't hold the process open,
+        # but whatever it hasn't written yet still gets flushed on the way out
+        atexit.register(self.close)
+
+    def append(self, event: Dict[str, Any]) -> None:
+        record = {"ts": time.time(), **event}
+        with self._cond:
+            if len(self._pending) == MAX_PENDING:
+                # the deque drops the oldest to make room
+                self._dropped += 1
+            self._pending.append(record)
+            if len(self._pending) >= FLUSH_BATCH:
+                self._cond.notify()
+
+    def close(self) -> None:
+        atexit.unregister(self.close)
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or len(self._pending) >= FLUSH_BATCH, FLUSH_INTERVAL)
+                batch, self._pending = list(self._pending), collections.deque(maxlen=MAX_PENDING)
+                closed = self._closed
+                dropped, self._dropped = self._dropped, 0
+            if dropped:
+                print(f"Journal: dropped {dropped} events while unable to write", file=sys.stderr)
+
+            try:
+                if batch:
+                    self._write(batch)
+                if closed:
+                    self._finish_segment()
+            except OSError as e:
+                if not self._failing:
+                    print(f"Journal: unable to write to {self.path}, will keep retrying: {e}", file=sys.stderr)
+                self._failing = True
+                if closed:
+                    return
+                # Put the batch back, and wait a bit before trying again
+                with self._cond:
+                    self._requeue(batch)
+                    self._cond.wait_for(lambda: self._closed, FLUSH_INTERVAL)
+                continue
+
+            if self._failing:
+                print("Journal: writing again", file=sys.stderr)
+                self._failing = False
+            if closed:
+                return
+
+    def _requeue(self, batch: Iterable[Dict[str, Any]]) -> None:
+        # Puts a batch back in front of what has arrived since, dropping the oldest past MAX_PENDING
+        pending = collections.deque(batch, maxlen=MAX_PENDING)
+        overflow = len(pending) + len(self._pending) - MAX_PENDING
+        pending.extend(self._pending)
+        self._pending = pending
+        if overflow > 0:
+            self._dropped += overflow
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        with timing.span("journal.write", count=len(batch)):
+            if self._file is not None and (
+                self._file.tell() >= SEGMENT_MAX_BYTES or time.time() - self._opened_at >= SEGMENT_MAX_AGE
+            ):
+                self._finish_segment()
+            if self._file is None:
+                # Segments opened in the same millisecond still each get their own file
+                start = int(time.time() * 1000)
+                while True:
+                    segment = self._segment_path(start)
+                    start += 1
+                    if os.path.exists(_index_path(segment)) or os.path.exists(segment):
+                        continue
+                    f = open(segment, "a")
+                    if _lock(f):
+                        break
+                    # another journal got there first
+                    f.close()
+                self._segment = segment
+                self._file = f
+                self._opened_at = time.time()
+                self._index = {}
+
+            good = self._file.tell()
+            index = dict(self._index, types=dict(self._index.get("types", {})))
+            try:
+                self._file.write("".join(json.dumps(record) + "\n" for record in batch))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                for record in batch:
+                    _update_index(index, record)
+                _write_index(self._segment, index)
+            except OSError:
+                # Cut off whatever part of the batch made it out, so the retry
+                # doesn't repeat it, and carry on in a new segment
+                self._abandon_segment(good)
+                raise
+            self._index = index
+
+    def _segment_path(self, start: int) -> str:
+        return os.path.join(self.path, f"events-{start:016d}.jsonl")
+
+    def _abandon_segment(self, size: int) -> None:
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._file = None
+        try:
+            os.truncate(self._segment, size)
+        except OSError:
+            # the next run rebuilds its index from whatever is there
+            pass
+
+    def _finish_segment(self) -> None:
+        if self._file is None or self._segment is None:
+            return
+        # Compress before closing, so the lock is held until the segment is gone
+        self._file.flush()
+        try:
+            _compress(self._segment)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def query(
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    types: Optional[List[str]] = None,
+    path: str = LOCAL_JOURNAL_DIR,
+) -> Iterator[Dict[str, Any]]:
+    segments: List[Tuple[float, str]] = []
+    for index_path in glob.glob(os.path.join(path, "events-*.idx.json")):
+        try:
+            with open(index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not index.get("count"):
+            continue
+        if since is not None and index["end"] < since:
+            continue
+        if until is not None and index["start"] > until:
+            continue
+        if types and not any(t in index["types"] for t in types):
+            continue
+        segment = index_path[:-len(".idx.json")] + ".jsonl"
+        segments.append((index["start"], segment))
+
+    for _, segment in sorted(segments):
+        for record in _read_segment(segment):
+            if since is not None and record["ts"] < since:
+                continue
+            if until is not None and record["ts"] > until:
+                continue
+            if types and record.get("type") not in types:
+                continue
+            yield record
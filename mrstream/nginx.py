@@ -1,17 +1,16 @@
 import subprocess
 
-from . import config
+from . import config, services
 
 
 def update_config():
-    cfg = config.get()
     with open(config.LOCAL_NGINX_PATH, "w") as f:
-        for key in cfg.keys():
-            if key.startswith("config."):
-                svc_name = key[7:]
-                if cfg[key]["enabled"] != "1":
-                    continue
-                f.write(f"push {cfg[key]['endpoint']};\n")
+        for svc in services.get().enabled:
+            endpoint = svc.endpoint()
+            if endpoint is None:
+                print(f"No endpoint for {svc.name}, run \"mrstream create\" first")
+                continue
+            f.write(f"push {endpoint};\n")
                 
 
 def run_server():
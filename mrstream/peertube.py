@@ -1,7 +1,7 @@
 from typing import Optional
 import requests
 
-from . import config
+from . import config, timing
 
 
 def authenticate(name: str) -> None:
@@ -9,20 +9,22 @@ def authenticate(name: str) -> None:
     sub = cfg[f"config.{name}"]
     
     if "client_id" not in sub:
-        clients = requests.get(f"{sub['base_url']}/api/v1/oauth-clients/local").json()
+        with timing.span("peertube.oauth_clients", service=name):
+            clients = requests.get(f"{sub['base_url']}/api/v1/oauth-clients/local").json()
         sub["client_id"] = clients["client_id"]
         sub["client_secret"] = clients["client_secret"]
 
     if "refresh_token" in sub:
-        response = requests.post(
-            f"{sub['base_url']}/api/v1/users/token",
-            {
-                "grant_type": "refresh_token",
-                "client_id": sub["client_id"],
-                "client_secret": sub["client_secret"],
-                "refresh_token": sub["refresh_token"],
-            },
-        )
+        with timing.span("peertube.refresh_token", service=name):
+            response = requests.post(
+                f"{sub['base_url']}/api/v1/users/token",
+                {
+                    "grant_type": "refresh_token",
+                    "client_id": sub["client_id"],
+                    "client_secret": sub["client_secret"],
+                    "refresh_token": sub["refresh_token"],
+                },
+            )
         if response.status_code == 200:
             rj = response.json()
             sub["token"] = rj["access_token"]
@@ -30,26 +32,28 @@ def authenticate(name: str) -> None:
             config.set(cfg)
             return
  
-    response = requests.post(
-        f"{sub['base_url']}/api/v1/users/token",
-        {
-            "grant_type": "password",
-            "client_id": sub["client_id"],
-            "client_secret": sub["client_secret"],
-            "username": sub["username"],
-            "password": sub["password"],
-        },
-    )
+    with timing.span("peertube.password_grant", service=name):
+        response = requests.post(
+            f"{sub['base_url']}/api/v1/users/token",
+            {
+                "grant_type": "password",
+                "client_id": sub["client_id"],
+                "client_secret": sub["client_secret"],
+                "username": sub["username"],
+                "password": sub["password"],
+            },
+        )
     response.raise_for_status()
     rj = response.json()
     sub["token"] = rj["access_token"]
     sub["refresh_token"] = rj["refresh_token"]
 
-    user = requests.get(f"{sub['base_url']}/api/v1/users/me",
-        headers={
-            "Authorization": f"Bearer {sub['token']}"
-        }
-    ).json()
+    with timing.span("peertube.users_me", service=name):
+        user = requests.get(f"{sub['base_url']}/api/v1/users/me",
+            headers={
+                "Authorization": f"Bearer {sub['token']}"
+            }
+        ).json()
 
     sub["channel_id"] = str(user["videoChannels"][0]["id"])
 
@@ -88,25 +92,59 @@ def create_stream(
     if lang:
         payload["language"] = lang
 
-    response = requests.post(
-        f"{sub['base_url']}/api/v1/videos/live",
-        json=payload,
-        headers=headers
-    )
+    with timing.span("peertube.create_live", service=name):
+        response = requests.post(
+            f"{sub['base_url']}/api/v1/videos/live",
+            json=payload,
+            headers=headers
+        )
     response.raise_for_status()
     video_data = response.json()["video"]
     print(f"{name}: {sub['base_url']}/w/{video_data['shortUUID']}")
 
     sub["current_live_id"] = video_data["uuid"]
 
-    endpoint = requests.get(
-        f"{sub['base_url']}/api/v1/videos/live/{sub['current_live_id']}",
-        headers=headers
-    ).json()
+    with timing.span("peertube.get_live", service=name):
+        endpoint = requests.get(
+            f"{sub['base_url']}/api/v1/videos/live/{sub['current_live_id']}",
+            headers=headers
+        ).json()
 
     sub["stream_key"] = endpoint["streamKey"]
     sub["endpoint"] = endpoint["rtmpUrl"] + f"/{sub['stream_key']}"
 
     config.set(cfg)
-    
 
+
+def update_stream(
+    name: str,
+    title: Optional[str] = None,
+    description: Optional[str] = None,
+    lang: Optional[str] = None,
+) -> None:
+    payload = {}
+    if title:
+        payload["name"] = title
+    if description:
+        payload["description"] = description
+    if lang:
+        payload["language"] = lang
+    if not payload:
+        return
+
+    if "current_live_id" not in config.get()[f"config.{name}"]:
+        print(f"No stream to update on {name}, run \"mrstream create\" first")
+        return
+
+    authenticate(name)
+    cfg = config.get()
+    sub = cfg[f"config.{name}"]
+    with timing.span("peertube.update_video", service=name):
+        response = requests.put(
+            f"{sub['base_url']}/api/v1/videos/{sub['current_live_id']}",
+            data=payload,
+            headers={
+                "Authorization": f"Bearer {sub['token']}"
+            }
+        )
+    response.raise_for_status()
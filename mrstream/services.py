@@ -0,0 +1,177 @@
+import abc
+import configparser
+import sys
+from typing import ClassVar, Dict, List, Optional, Set, Tuple, Type
+
+from . import config
+
+# Each service type is a Service subclass, registered under the "type" value
+# used in its config section. Backend modules are imported inside the methods,
+# so loading the registry stays cheap.
+SERVICE_TYPES: Dict[str, Type["Service"]] = {}
+
+
+def register(cls: Type["Service"]) -> Type["Service"]:
+    SERVICE_TYPES[cls.type] = cls
+    return cls
+
+
+class Service(abc.ABC):
+    type: ClassVar[str]
+
+    def __init__(self, name: str, settings: Dict[str, str]) -> None:
+        self.name = name
+        self.settings = settings
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.get("enabled") == "1"
+
+    def authenticate(self) -> None:
+        # Log in ahead of time, so create() and update() don't have to wait for it
+        pass
+
+    @abc.abstractmethod
+    def create(
+        self,
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+        announcement: Optional[str] = None,
+        game: Optional[str] = None,
+        gameid: Optional[str] = None,
+        lang: Optional[str] = None,
+        vod: bool = False,
+    ) -> None:
+        ...
+
+    @abc.abstractmethod
+    def update(
+        self,
+        title: Optional[str] = None,
+        description: Optional[str] = None,
+        announcement: Optional[str] = None,
+        game: Optional[str] = None,
+        gameid: Optional[str] = None,
+        lang: Optional[str] = None,
+        vod: bool = False,
+    ) -> None:
+        ...
+
+    def endpoint(self) -> Optional[str]:
+        # RTMP URL to push the stream to, once create() has run
+        return self.settings.get("endpoint")
+
+
+@register
+class TwitchService(Service):
+    type = "twitch"
+
+    def authenticate(self) -> None:
+        from . import twitch
+        # Also keeps the client around for later commands in the same process
+        twitch.run_sync(twitch.get_client(self.name))
+
+    def create(self, title=None, description=None, announcement=None, game=None, gameid=None, lang=None, vod=False) -> None:
+        from . import twitch
+        twitch.run_sync(twitch.create_stream(
+            self.name,
+            title=title,
+            description=description,
+            announcement=announcement,
+            game=game,
+            gameid=gameid,
+            lang=lang,
+            vod=vod
+        ))
+
+    def update(self, title=None, description=None, announcement=None, game=None, gameid=None, lang=None, vod=False) -> None:
+        from . import twitch
+        twitch.run_sync(twitch.update_stream(self.name, title=title, game=game, gameid=gameid, lang=lang))
+
+
+@register
+class PeerTubeService(Service):
+    type = "peertube"
+
+    def authenticate(self) -> None:
+        from . import peertube
+        peertube.authenticate(self.name)
+
+    def create(self, title=None, description=None, announcement=None, game=None, gameid=None, lang=None, vod=False) -> None:
+        from . import peertube
+        peertube.create_stream(
+            self.name,
+            title=title,
+            description=description,
+            announcement=announcement,
+            game=game,
+            gameid=gameid,
+            lang=lang,
+            vod=vod
+        )
+
+    def update(self, title=None, description=None, announcement=None, game=None, gameid=None, lang=None, vod=False) -> None:
+        from . import peertube
+        peertube.update_stream(self.name, title=title, description=description, lang=lang)
+
+
+@register
+class RTMPService(Service):
+    # A fixed RTMP destination with no API, e.g. a self-hosted server
+    type = "rtmp"
+
+    def create(self, title=None, description=None, announcement=None, game=None, gameid=None, lang=None, vod=False) -> None:
+        print(f"{self.name}: {self.settings['url']}")
+
+    def update(self, title=None, description=None, announcement=None, game=None, gameid=None, lang=None, vod=False) -> None:
+        pass
+
+    def endpoint(self) -> Optional[str]:
+        url = self.settings["url"].rstrip("/")
+        if self.settings.get("stream_key"):
+            return f"{url}/{self.settings['stream_key']}"
+        return url
+
+
+# Sections already warned about, so a rebuild doesn't repeat the warning
+_WARNED: Set[Tuple[str, str]] = set()
+
+
+class Registry:
+    def __init__(self, cfg: configparser.ConfigParser) -> None:
+        self.services: Dict[str, Service] = {}
+        self.enabled: List[Service] = []
+        self.by_type: Dict[str, List[Service]] = {}
+
+        for key in cfg.sections():
+            if not key.startswith("config."):
+                continue
+            name = key[7:]
+            settings = dict(cfg[key])
+            service_type = settings.get("type", "")
+            cls = SERVICE_TYPES.get(service_type)
+            if cls is None:
+                if (name, service_type) not in _WARNED:
+                    _WARNED.add((name, service_type))
+                    print(f"Skipping \"{name}\", unknown service type \"{service_type}\"", file=sys.stderr)
+                continue
+            svc = cls(name, settings)
+            self.services[name] = svc
+            self.by_type.setdefault(cls.type, []).append(svc)
+            if svc.enabled:
+                self.enabled.append(svc)
+
+    def of_type(self, service_type: str) -> List[Service]:
+        return self.by_type.get(service_type, [])
+
+
+# Rebuilt only when the config changes
+_REGISTRY: Optional[Tuple[int, Registry]] = None
+
+
+def get() -> Registry:
+    global _REGISTRY
+    generation = config.generation()
+    if _REGISTRY is None or _REGISTRY[0] != generation:
+        _REGISTRY = (generation, Registry(config.get()))
+    return _REGISTRY[1]
@@ -0,0 +1,90 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Dict, Iterator, List
+
+# Spans are only recorded after enable() is called (i.e. with --profile);
+# otherwise span() hands back the same do-nothing context manager every time.
+_ENABLED: bool = False
+_EVENTS: List[Dict[str, Any]] = []
+_NULL: ContextManager[None] = nullcontext()
+
+
+def enable() -> None:
+    global _ENABLED
+    _ENABLED = True
+
+
+def disable() -> None:
+    global _ENABLED
+    _ENABLED = False
+
+
+def span(name: str, **args: Any) -> ContextManager[None]:
+    if not _ENABLED:
+        return _NULL
+    return _record(name, args)
+
+
+def _track_id() -> int:
+    # Give each asyncio task its own track, so concurrent awaits don't overlap.
+    # Only look if asyncio is already loaded; importing it here would slow down startup.
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is not None:
+        try:
+            task = asyncio.current_task()
+            if task is not None:
+                return id(task)
+        except RuntimeError:
+            pass
+    return threading.get_ident()
+
+
+@contextmanager
+def _record(name: str, args: Dict[str, Any]) -> Iterator[None]:
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        end = time.perf_counter_ns()
+        _EVENTS.append({
+            "name": name,
+            "ph": "X",
+            "ts": start / 1000,
+            "dur": (end - start) / 1000,
+            "pid": os.getpid(),
+            "tid": _track_id(),
+            "args": args,
+        })
+
+
+def collect() -> List[Dict[str, Any]]:
+    events = list(_EVENTS)
+    _EVENTS.clear()
+    return events
+
+
+def extend(events: List[Dict[str, Any]]) -> None:
+    _EVENTS.extend(events)
+
+
+def dump(path: str) -> None:
+    # Chrome trace format; open with chrome://tracing or https://ui.perfetto.dev
+    with open(path, "w") as f:
+        json.dump({"traceEvents": _EVENTS, "displayTimeUnit": "ms"}, f, default=str)
+
+
+def print_summary() -> None:
+    totals: Dict[str, List[float]] = {}
+    for ev in _EVENTS:
+        totals.setdefault(ev["name"], []).append(ev["dur"] / 1000)
+
+    print(f"{'span':<40} {'count':>6} {'total ms':>10} {'mean ms':>10} {'max ms':>10}", file=sys.stderr)
+    for name, durations in sorted(totals.items(), key=lambda x: sum(x[1]), reverse=True):
+        print(
+            f"{name:<40} {len(durations):>6} {sum(durations):>10.1f} {sum(durations)/len(durations):>10.1f} {max(durations):>10.1f}",
+            file=sys.stderr,
+        )
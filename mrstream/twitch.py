@@ -1,12 +1,15 @@
 import asyncio
 from contextlib import asynccontextmanager
 from functools import partial
-from typing import AsyncContextManager, AsyncIterator, Awaitable, Callable, List, Optional
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Coroutine, List, Optional, TypeVar
 from typing_extensions import NamedTuple
 from websockets import server as websocket_server
 from websockets.exceptions import WebSocketException 
 import requests
 import json
+import multiprocessing
+import os
+import socket
 
 from twitchAPI.chat import Chat, ChatEvent, ChatMessage
 from twitchAPI.object.api import SearchCategoryResult, Video
@@ -17,7 +20,7 @@ from twitchAPI.oauth import UserAuthenticator, validate_token, refresh_access_to
 from twitchAPI.eventsub.websocket import EventSubWebsocket
 from websockets.typing import Data
 
-from . import config
+from . import config, journal, timing
 
 
 TWITCH_SCOPES = [
@@ -32,6 +35,21 @@ TWITCH_SCOPES = [
     AuthScope.CHANNEL_BOT,
 ]
 
+T = TypeVar("T")
+
+# Keep one event loop around, so that clients created on it can be reused
+# by later calls in the same process (e.g. the daemon).
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_CLIENTS: dict[str, Twitch] = {}
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    global _LOOP
+    if _LOOP is None:
+        _LOOP = asyncio.new_event_loop()
+        asyncio.set_event_loop(_LOOP)
+    return _LOOP.run_until_complete(coro)
+
 
 async def authenticate(name: str) -> None:
     cfg = config.get()
@@ -41,13 +59,15 @@ async def authenticate(name: str) -> None:
     client_secret: str = sub.get("client_secret")
 
     if "token" in sub:
-        validation = await validate_token(sub["token"])
+        with timing.span("twitch.validate_token", service=name):
+            validation = await validate_token(sub["token"])
         if "user_id" in validation:
             return
         if "refresh_token" in sub and sub["refresh_token"].strip():
-            token, refresh_token = await refresh_access_token(
-                sub["refresh_token"], client_id, client_secret
-            )
+            with timing.span("twitch.refresh_access_token", service=name):
+                token, refresh_token = await refresh_access_token(
+                    sub["refresh_token"], client_id, client_secret
+                )
             sub["token"] = token
             sub["refresh_token"] = refresh_token
             config.set(cfg)
@@ -56,7 +76,8 @@ async def authenticate(name: str) -> None:
     tw = Twitch(client_id, client_secret)
 
     ua = UserAuthenticator(tw, TWITCH_SCOPES)
-    auth_result = await ua.authenticate()
+    with timing.span("twitch.user_authenticate", service=name):
+        auth_result = await ua.authenticate()
     if auth_result is None:
         raise RuntimeError("User authentication failed")
 
@@ -64,7 +85,8 @@ async def authenticate(name: str) -> None:
     sub["refresh_token"] = auth_result[1]
 
     # Run the validator again
-    validation = await validate_token(sub["token"])
+    with timing.span("twitch.validate_token", service=name):
+        validation = await validate_token(sub["token"])
     if "user_id" not in validation:
         raise RuntimeError("Validation of authenticated token failed")
 
@@ -74,7 +96,10 @@ async def authenticate(name: str) -> None:
     config.set(cfg)
 
 
-async def get_client(name: str) -> Twitch:
+async def get_client(name: str, cache: bool = True) -> Twitch:
+    if cache and name in _CLIENTS:
+        return _CLIENTS[name]
+
     await authenticate(name)
 
     cfg = config.get()
@@ -84,24 +109,47 @@ async def get_client(name: str) -> Twitch:
     token: str = sub.get("token")
     refresh_token: str = sub.get("refresh_token")
     tw = Twitch(client_id, client_secret)
-    await tw.set_user_authentication(token, TWITCH_SCOPES, refresh_token)
+
+    async def save_refreshed_token(token: str, refresh_token: str) -> None:
+        cfg = config.get()
+        cfg[f"config.{name}"]["token"] = token
+        cfg[f"config.{name}"]["refresh_token"] = refresh_token
+        config.set(cfg)
+
+    tw.user_auth_refresh_callback = save_refreshed_token
+    with timing.span("twitch.set_user_authentication", service=name):
+        await tw.set_user_authentication(token, TWITCH_SCOPES, refresh_token)
+    if cache:
+        _CLIENTS[name] = tw
     return tw
 
 
 async def search_games(name: str, title: str) -> list[SearchCategoryResult]:
     tw = await get_client(name)
-    results = tw.search_categories(title)
-    return [x async for x in results]
+    with timing.span("twitch.search_categories", service=name):
+        return [x async for x in tw.search_categories(title)]
 
 
 async def get_past_streams(name: str) -> list[Video]:
     tw = await get_client(name)
     cfg = config.get()
     sub = cfg[f"config.{name}"]
-    highlights = tw.get_videos(
-        user_id=sub.get("user_id"), video_type=VideoType.HIGHLIGHT
-    )
-    return [x async for x in highlights]
+    with timing.span("twitch.get_videos", service=name):
+        highlights = tw.get_videos(
+            user_id=sub.get("user_id"), video_type=VideoType.HIGHLIGHT
+        )
+        return [x async for x in highlights]
+
+
+async def _resolve_game_id(tw: Twitch, name: str, game: Optional[str], gameid: Optional[str]) -> Optional[str]:
+    # An explicit game ID wins; otherwise take the best match for the game name
+    if game is None or gameid is not None:
+        return gameid
+    with timing.span("twitch.search_categories", service=name):
+        game_lookups = [x async for x in tw.search_categories(game)]
+    if game_lookups:
+        return game_lookups[0].id
+    return None
 
 
 async def create_stream(
@@ -117,18 +165,18 @@ async def create_stream(
     tw = await get_client(name)
     cfg = config.get()
     sub = cfg[f"config.{name}"]
-    sub["stream_key"] = await tw.get_stream_key(sub.get("user_id"))
-    if game is not None and gameid is None:
-        game_lookups = [x async for x in tw.search_categories(game)]
-        if game_lookups:
-            gameid = game_lookups[0].id
-    await tw.modify_channel_information(
-        sub["user_id"], game_id=gameid, broadcaster_language=lang, title=title
-    )
-
-    ingest = requests.get("https://ingest.twitch.tv/ingests").json()["ingests"][0][
-        "url_template"
-    ]
+    with timing.span("twitch.get_stream_key", service=name):
+        sub["stream_key"] = await tw.get_stream_key(sub.get("user_id"))
+    gameid = await _resolve_game_id(tw, name, game, gameid)
+    with timing.span("twitch.modify_channel_information", service=name):
+        await tw.modify_channel_information(
+            sub["user_id"], game_id=gameid, broadcaster_language=lang, title=title
+        )
+
+    with timing.span("twitch.ingests"):
+        ingest = requests.get("https://ingest.twitch.tv/ingests").json()["ingests"][0][
+            "url_template"
+        ]
     sub["endpoint"] = ingest.format(stream_key=sub["stream_key"])
 
     print(f"{name}: https://twitch.tv/{sub['login']}")
@@ -136,93 +184,190 @@ async def create_stream(
     config.set(cfg)
 
 
+async def update_stream(
+    name: str,
+    title: Optional[str] = None,
+    game: Optional[str] = None,
+    gameid: Optional[str] = None,
+    lang: Optional[str] = None,
+) -> None:
+    if title is None and game is None and gameid is None and lang is None:
+        return
+    tw = await get_client(name)
+    cfg = config.get()
+    sub = cfg[f"config.{name}"]
+    gameid = await _resolve_game_id(tw, name, game, gameid)
+    with timing.span("twitch.modify_channel_information", service=name):
+        await tw.modify_channel_information(
+            sub["user_id"], game_id=gameid, broadcaster_language=lang, title=title
+        )
+
+
 @asynccontextmanager
 async def get_eventsub_websocket(tw: Twitch) -> AsyncIterator[EventSubWebsocket]:
     eventsub = EventSubWebsocket(tw)
-    eventsub.start()
+    with timing.span("twitch.eventsub_start"):
+        eventsub.start()
     try:
         yield eventsub
     finally:
-        await eventsub.stop()
-        await tw.close()
+        with timing.span("twitch.eventsub_stop"):
+            await eventsub.stop()
+            await tw.close()
+
+
+
+class BridgeClient(NamedTuple):
+    ws: websocket_server.WebSocketServerProtocol
+    queue: asyncio.Queue[str]
 
 
+# Events waiting for each client. A client that lets CLIENT_QUEUE_SIZE events
+# pile up is disconnected, rather than letting its backlog grow without limit.
+CLIENT_QUEUE_SIZE = 256
+EVENT_BUS: dict[tuple, BridgeClient] = {}
+
+# Bridge worker processes connected to this one, when running with --workers.
+# Events for a worker with more than WORKER_BUFFER_SIZE bytes unsent are dropped
+# until it catches up.
+WORKER_BUFFER_SIZE = 4 * 1024 * 1024
+_WORKERS: list[asyncio.StreamWriter] = []
+_LAGGING_WORKERS: dict[asyncio.StreamWriter, int] = {}
+_JOURNAL: Optional[journal.Journal] = None
+# The loop serving the clients and workers above. twitchAPI runs the EventSub
+# callbacks on its own thread and loop, so publish() passes events over to this one.
+_BRIDGE_LOOP: Optional[asyncio.AbstractEventLoop] = None
+
+# Emote set ID -> emote ID -> (name, URL)
+_EMOTES: dict[str, dict[str, tuple[str, str]]] = {}
+
+
+async def get_emote_name_url(tw: Twitch, set_id: str, emote_id: str) -> tuple[str, str]:
+    if set_id not in _EMOTES:
+        with timing.span("twitch.get_emote_sets", set_id=set_id):
+            set_result = await tw.get_emote_sets([set_id])
+        _EMOTES[set_id] = {}
+        for emote in set_result.data:
+            result = set_result.template
+            result = result.replace("{{id}}", emote.id)
+            result = result.replace("{{format}}", "animated" if "animated" in emote.format else "static")
+            result = result.replace("{{theme_mode}}", "light" if "light" in emote.theme_mode else "dark")
+            result = result.replace("{{scale}}", max(emote.scale))
+            _EMOTES[set_id][emote.id] = (emote.name, result)
+    return _EMOTES[set_id][emote_id]
+
+
+def fan_out(data: str) -> None:
+    for address, client in list(EVENT_BUS.items()):
+        try:
+            client.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            print(f"Client too slow, disconnecting - {address}")
+            del EVENT_BUS[address]
+            # Drops whatever is stuck in the send buffer too
+            client.ws.transport.abort()
+
+
+def _send_to_worker(writer: asyncio.StreamWriter, line: bytes) -> None:
+    if writer.transport.get_write_buffer_size() > WORKER_BUFFER_SIZE:
+        if writer not in _LAGGING_WORKERS:
+            print("Worker is falling behind, dropping events for it")
+        _LAGGING_WORKERS[writer] = _LAGGING_WORKERS.get(writer, 0) + 1
+        return
+    if writer in _LAGGING_WORKERS:
+        print(f"Worker caught up, {_LAGGING_WORKERS.pop(writer)} events dropped")
+    writer.write(line)
+
+
+def publish(event: dict) -> None:
+    # Safe to call from any thread; the queues and transports belong to the bridge loop
+    loop = _BRIDGE_LOOP
+    if loop is not None and _running_loop() is not loop:
+        loop.call_soon_threadsafe(_publish, event)
+    else:
+        _publish(event)
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _publish(event: dict) -> None:
+    # Encode once, then hand the same string to every local client and worker
+    data = json.dumps(event)
+    fan_out(data)
+    if _WORKERS:
+        line = data.encode("utf8") + b"\n"
+        for writer in _WORKERS:
+            _send_to_worker(writer, line)
+    if _JOURNAL is not None:
+        _JOURNAL.append(event)
 
-EVENT_BUS: dict[tuple, asyncio.Queue[str]] = {}
 
 async def eventsub_handler(client_response: Callable[[str], Awaitable[None]], ws: websocket_server.WebSocketServerProtocol) -> None:
     print(f"Client joined - {ws.remote_address}")
-    EVENT_BUS[ws.remote_address] = asyncio.Queue()
-    try:
-        while not ws.closed:
-            try:
-                data = EVENT_BUS[ws.remote_address].get_nowait()
-                await ws.send(data)
-            except asyncio.QueueEmpty:
-                pass
+    queue: asyncio.Queue[str] = asyncio.Queue(CLIENT_QUEUE_SIZE)
+    EVENT_BUS[ws.remote_address] = BridgeClient(ws, queue)
 
-            try:
-                data: str = await asyncio.wait_for(ws.recv(), 0.1) # type: ignore
-                await client_response(data)
-            except (WebSocketException, asyncio.TimeoutError):
-                pass
+    async def send_events() -> None:
+        try:
+            while True:
+                await ws.send(await queue.get())
+        except WebSocketException:
+            pass
 
+    sender = asyncio.create_task(send_events())
+    try:
+        async for data in ws:
+            await client_response(data) # type: ignore
+    except WebSocketException:
+        pass
     finally:
+        sender.cancel()
+        EVENT_BUS.pop(ws.remote_address, None)
         print(f"Client quit - {ws.remote_address}")
 
 
-async def run_eventsub_server(name: str, port: int=26661) -> None:
-    cfg = config.get()
-    sub = cfg[f"config.{name}"]
-    tw = await get_client(name)
+async def listen_eventsub(tw: Twitch, eventsub: EventSubWebsocket, user_id: str) -> Callable[[Data], Awaitable[None]]:
+    # Subscribes to the channel events and returns the handler for messages from websocket clients
+    global _BRIDGE_LOOP
+    _BRIDGE_LOOP = asyncio.get_running_loop()
 
     async def event_raid(ev: ChannelRaidEvent) -> None:
-        print(f"RAID - {ev.event.from_broadcaster_user_name}, {ev.event.viewers} souls")
-        for queue in EVENT_BUS.values():
-            await queue.put(json.dumps({
+        with timing.span("eventsub.raid"):
+            print(f"RAID - {ev.event.from_broadcaster_user_name}, {ev.event.viewers} souls")
+            publish({
                 "type": "raid",
                 "username": ev.event.from_broadcaster_user_name,
                 "viewers": ev.event.viewers,
-            }))
+            })
 
     async def event_follow(ev: ChannelFollowEvent) -> None:
-        print(f"FOLLOW - {ev.event.user_name}")
-        for queue in EVENT_BUS.values():
-            await queue.put(json.dumps({
+        with timing.span("eventsub.follow"):
+            print(f"FOLLOW - {ev.event.user_name}")
+            publish({
                 "type": "follow",
                 "username": ev.event.user_name,
-            }))
-
-    EMOTES: dict[str, dict[str, tuple[str, str]]] = {}
-    async def get_emote_name_url(set_id: str, emote_id: str) -> tuple[str, str]:
-        if set_id not in EMOTES:
-            set_result = await tw.get_emote_sets([set_id])
-            EMOTES[set_id] = {}
-            for emote in set_result.data:
-                result = set_result.template
-                result = result.replace("{{id}}", emote.id)
-                result = result.replace("{{format}}", "animated" if "animated" in emote.format else "static")
-                result = result.replace("{{theme_mode}}", "light" if "light" in emote.theme_mode else "dark")
-                result = result.replace("{{scale}}", max(emote.scale))
-                EMOTES[set_id][emote.id] = (emote.name, result)
-        return EMOTES[set_id][emote_id]
+            })
 
     async def event_chat_message(ev: ChannelChatMessageEvent) -> None:
-        print(f"CHAT MESSAGE - {ev.event.message_id} <{ev.event.chatter_user_name}> {ev.event.message.text}")
-        for queue in EVENT_BUS.values():
-            await queue.put(json.dumps({
+        with timing.span("eventsub.chat_message"):
+            print(f"CHAT MESSAGE - {ev.event.message_id} <{ev.event.chatter_user_name}> {ev.event.message.text}")
+            publish({
                 "type": "message",
                 "username": ev.event.chatter_user_name,
                 "text": ev.event.message.text,
                 "id": ev.event.message_id,
-            }))
-
-        for frag in ev.event.message.fragments:
-            if frag.type == "emote" and frag.emote:
-                name, url = await get_emote_name_url(frag.emote.emote_set_id, frag.emote.id)
-                print(f"EMOTE - {ev.event.message_id} <{ev.event.chatter_user_name}> {name} {url}")
-                for queue in EVENT_BUS.values():
-                    await queue.put(json.dumps({
+            })
+
+            for frag in ev.event.message.fragments:
+                if frag.type == "emote" and frag.emote:
+                    name, url = await get_emote_name_url(tw, frag.emote.emote_set_id, frag.emote.id)
+                    print(f"EMOTE - {ev.event.message_id} <{ev.event.chatter_user_name}> {name} {url}")
+                    publish({
                         "type": "emote",
                         "username": ev.event.chatter_user_name,
                         "message_id": ev.event.message_id,
@@ -231,23 +376,102 @@ async def run_eventsub_server(name: str, port: int=26661) -> None:
                         "owner_id": frag.emote.owner_id,
                         "name": name,
                         "url": url,
-                    }))
+                    })
         
     async def handle_client_response(message: Data) -> None:
         data = json.loads(message)
         if isinstance(data, dict):
             if data.get("type") == "message":
-                await tw.send_chat_message(sub.get("user_id"), sub.get("user_id"), data.get("text", ""), data.get("reply_id"))
+                with timing.span("twitch.send_chat_message"):
+                    await tw.send_chat_message(user_id, user_id, data.get("text", ""), data.get("reply_id"))
                 return
         print(f"Unknown data: {message}")
     
 
-    async with get_eventsub_websocket(tw) as eventsub:
-        await eventsub.listen_channel_follow_v2(sub.get("user_id"), sub.get("user_id"), event_follow)
-        await eventsub.listen_channel_raid(event_raid, sub.get("user_id"), None)
-        await eventsub.listen_channel_chat_message(sub.get("user_id"), sub.get("user_id"), event_chat_message)
-        async with websocket_server.serve(partial(eventsub_handler, handle_client_response), "", port):
-            print(f"Websocket server running on ws://localhost:{port}")
-            await asyncio.Future()
+    with timing.span("twitch.eventsub_subscribe"):
+        await eventsub.listen_channel_follow_v2(user_id, user_id, event_follow)
+        await eventsub.listen_channel_raid(event_raid, user_id, None)
+        await eventsub.listen_channel_chat_message(user_id, user_id, event_chat_message)
+    return handle_client_response
+
+
+async def run_eventsub_worker(bus_path: str, port: int) -> None:
+    # Serves websocket clients on a port shared with the other workers,
+    # relaying events from the EventSub process over the bus
+    reader, writer = await asyncio.open_unix_connection(bus_path)
+
+    async def client_response(message: Data) -> None:
+        if isinstance(message, bytes):
+            message = message.decode("utf8")
+        writer.write(json.dumps(message).encode("utf8") + b"\n")
+        await writer.drain()
 
+    async with websocket_server.serve(partial(eventsub_handler, client_response), "", port, reuse_port=True):
+        while line := await reader.readline():
+            fan_out(line.decode("utf8").rstrip("\n"))
 
+
+def _eventsub_worker_main(bus_path: str, port: int) -> None:
+    try:
+        run_sync(run_eventsub_worker(bus_path, port))
+    except KeyboardInterrupt:
+        pass
+
+
+async def run_eventsub_server(name: str, port: int=26661, workers: int=0, record_events: bool=True) -> None:
+    global _JOURNAL
+    if workers and not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("Running multiple workers needs SO_REUSEPORT, which this platform doesn't have")
+
+    cfg = config.get()
+    sub = cfg[f"config.{name}"]
+    # The eventsub websocket closes the client when it's done, so don't share it
+    tw = await get_client(name, cache=False)
+
+    if record_events:
+        _JOURNAL = journal.Journal()
+    try:
+        await _serve_eventsub(tw, sub.get("user_id"), port, workers)
+    finally:
+        if _JOURNAL is not None:
+            _JOURNAL.close()
+            _JOURNAL = None
+
+
+async def _serve_eventsub(tw: Twitch, user_id: str, port: int, workers: int) -> None:
+    async with get_eventsub_websocket(tw) as eventsub:
+        client_response = await listen_eventsub(tw, eventsub, user_id)
+        if not workers:
+            async with websocket_server.serve(partial(eventsub_handler, client_response), "", port):
+                print(f"Websocket server running on ws://localhost:{port}")
+                await asyncio.Future()
+
+        # Workers share the port and serve the clients; this process only
+        # talks to Twitch and publishes events to the workers over the bus
+        async def handle_worker(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            _WORKERS.append(writer)
+            try:
+                while line := await reader.readline():
+                    try:
+                        await client_response(json.loads(line))
+                    except Exception as e:
+                        print(f"Error handling client message: {e}")
+            finally:
+                _WORKERS.remove(writer)
+                _LAGGING_WORKERS.pop(writer, None)
+                writer.close()
+
+        os.makedirs(config.LOCAL_CONFIG_DIR, exist_ok=True)
+        bus_path = os.path.join(config.LOCAL_CONFIG_DIR, f"eventsub-{port}.sock")
+        ctx = multiprocessing.get_context("spawn")
+        processes = [ctx.Process(target=_eventsub_worker_main, args=(bus_path, port), daemon=True) for _ in range(workers)]
+        async with await asyncio.start_unix_server(handle_worker, bus_path):
+            for process in processes:
+                process.start()
+            print(f"Websocket server running on ws://localhost:{port} with {workers} workers")
+            try:
+                await asyncio.Future()
+            finally:
+                for process in processes:
+                    process.terminate()
+                os.unlink(bus_path)
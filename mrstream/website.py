@@ -1,20 +1,17 @@
 
-import asyncio
 import os
 
-from . import config, twitch
+from . import services, timing, twitch
 
 
 def update_website(base_path: str) -> None:
-    cfg = config.get()
-    for k in cfg.keys():
-        if k.startswith("config.") and cfg[k]["type"] == "twitch":
-            svc_name = k[7:]
-            update_video_posts(svc_name, base_path)
+    for svc in services.get().of_type("twitch"):
+        update_video_posts(svc.name, base_path)
 
 
 def update_video_posts(name: str, base_path: str) -> None:
-    streams = asyncio.get_event_loop().run_until_complete(twitch.get_past_streams(name))
+    with timing.span("website.get_past_streams", service=name):
+        streams = twitch.run_sync(twitch.get_past_streams(name))
 
     for stream in streams:
         ts = stream.created_at
@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+from mrstream import config, game_lookup, services
+
+
+@pytest.fixture
+def config_dir(tmp_path, monkeypatch):
+    # Point mrstream at an empty config directory, and forget anything cached from the real one
+    monkeypatch.setattr(config, "LOCAL_CONFIG_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "LOCAL_CONFIG_PATH", os.path.join(str(tmp_path), "mrstream.ini"))
+    monkeypatch.setattr(config, "_CACHE", None)
+    monkeypatch.setattr(services, "_REGISTRY", None)
+    monkeypatch.setattr(services, "_WARNED", set())
+    monkeypatch.setattr(game_lookup, "TWITCH_GAME_LIST_PATH", os.path.join(str(tmp_path), "twitch_game_info.csv"))
+    return tmp_path
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import threading
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+from websockets import client as websocket_client
+from websockets import server as websocket_server
+
+from mrstream import twitch
+
+
+@pytest.fixture(autouse=True)
+def bridge_loop(monkeypatch):
+    monkeypatch.setattr(twitch, "_BRIDGE_LOOP", None)
+
+
+async def ignore_response(message):
+    pass
+
+
+class FakeEventSub:
+    # Captures the callbacks instead of subscribing to Twitch
+    def __init__(self):
+        self.callbacks = {}
+
+    async def listen_channel_follow_v2(self, broadcaster_user_id, moderator_user_id, callback):
+        self.callbacks["follow"] = callback
+
+    async def listen_channel_raid(self, callback, to_broadcaster_user_id, from_broadcaster_user_id):
+        self.callbacks["raid"] = callback
+
+    async def listen_channel_chat_message(self, broadcaster_user_id, user_id, callback):
+        self.callbacks["chat"] = callback
+
+
+def test_events_from_another_thread_are_delivered():
+    # twitchAPI runs the EventSub callbacks on its own thread's loop,
+    # while the bridge loop sits waiting on its sockets
+    async def run():
+        eventsub = FakeEventSub()
+        client_response = await twitch.listen_eventsub(None, eventsub, "0")
+        async with websocket_server.serve(partial(twitch.eventsub_handler, client_response), "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            async with websocket_client.connect(f"ws://127.0.0.1:{port}") as ws:
+                while not twitch.EVENT_BUS:
+                    await asyncio.sleep(0.01)
+
+                follow = SimpleNamespace(event=SimpleNamespace(user_name="a"))
+                thread = threading.Thread(target=asyncio.run, args=(eventsub.callbacks["follow"](follow),))
+                thread.start()
+                message = await asyncio.wait_for(ws.recv(), 2)
+                thread.join()
+        assert json.loads(message) == {"type": "follow", "username": "a"}
+
+    asyncio.run(run())
+
+
+def test_slow_client_is_disconnected():
+    async def run():
+        async with websocket_server.serve(partial(twitch.eventsub_handler, ignore_response), "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            # Do the websocket handshake by hand, then never read again,
+            # so the socket buffers and then the client's queue fill up
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(
+                b"GET / HTTP/1.1\r\n"
+                b"Host: 127.0.0.1\r\n"
+                b"Upgrade: websocket\r\n"
+                b"Connection: Upgrade\r\n"
+                b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+                b"Sec-WebSocket-Version: 13\r\n\r\n"
+            )
+            await reader.readuntil(b"\r\n\r\n")
+            while not twitch.EVENT_BUS:
+                await asyncio.sleep(0.01)
+
+            payload = {"type": "message", "text": "x" * 100000}
+            for _ in range(10000):
+                twitch.publish(payload)
+                await asyncio.sleep(0)
+                if not twitch.EVENT_BUS:
+                    break
+            assert not twitch.EVENT_BUS
+            writer.close()
+
+    asyncio.run(run())
+
+
+class FakeWorker:
+    def __init__(self, buffered: int) -> None:
+        self.transport = SimpleNamespace(get_write_buffer_size=lambda: buffered)
+        self.written = []
+
+    def write(self, data: bytes) -> None:
+        self.written.append(data)
+
+
+def test_lagging_worker_drops_events():
+    lagging = FakeWorker(twitch.WORKER_BUFFER_SIZE + 1)
+    healthy = FakeWorker(0)
+    twitch._WORKERS.extend([lagging, healthy])
+    try:
+        twitch.publish({"type": "follow", "username": "a"})
+        twitch.publish({"type": "follow", "username": "b"})
+        assert twitch._LAGGING_WORKERS[lagging] == 2
+    finally:
+        twitch._WORKERS.clear()
+        twitch._LAGGING_WORKERS.clear()
+    assert lagging.written == []
+    assert len(healthy.written) == 2
@@ -0,0 +1,157 @@
+import argparse
+import configparser
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from mrstream import config, daemon, services
+
+
+def add_service(name, service_type="rtmp", enabled="1"):
+    cfg = config.get()
+    cfg[f"config.{name}"] = {"type": service_type, "url": "rtmp://localhost/live", "enabled": enabled}
+    config.set(cfg)
+
+
+@pytest.fixture
+def running_daemon(config_dir):
+    path = os.path.join(str(config_dir), "d.sock")
+    thread = threading.Thread(target=daemon.serve, kwargs={"path": path}, daemon=True)
+    thread.start()
+    for _ in range(200):
+        if os.path.exists(path):
+            break
+        time.sleep(0.01)
+    yield path
+    daemon.stop()
+    thread.join(5)
+
+
+def test_forward_without_daemon(config_dir):
+    path = os.path.join(str(config_dir), "d.sock")
+    assert not daemon.forward("enable", argparse.Namespace(NAME="x"), path=path)
+
+
+def test_forward_to_stale_socket(config_dir):
+    path = os.path.join(str(config_dir), "d.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+    assert not daemon.forward("enable", argparse.Namespace(NAME="x"), path=path)
+
+
+def test_serve_replaces_stale_socket(config_dir):
+    path = os.path.join(str(config_dir), "d.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    thread = threading.Thread(target=daemon.serve, kwargs={"path": path}, daemon=True)
+    thread.start()
+    try:
+        for _ in range(200):
+            if daemon._SERVER is not None:
+                break
+            time.sleep(0.01)
+        add_service("local", enabled="0")
+        assert daemon.forward("enable", argparse.Namespace(NAME="local"), path=path)
+    finally:
+        daemon.stop()
+        thread.join(5)
+    assert not os.path.exists(path)
+
+
+def test_serve_logs_in_to_every_service(config_dir, monkeypatch):
+    add_service("first")
+    add_service("second", enabled="0")
+    logged_in = []
+
+    def authenticate(self):
+        logged_in.append(self.name)
+        if self.name == "first":
+            raise RuntimeError("offline")
+
+    monkeypatch.setattr(services.RTMPService, "authenticate", authenticate)
+    path = os.path.join(str(config_dir), "d.sock")
+    thread = threading.Thread(target=daemon.serve, kwargs={"path": path}, daemon=True)
+    thread.start()
+    try:
+        for _ in range(200):
+            if daemon._SERVER is not None:
+                break
+            time.sleep(0.01)
+        # A service that can't log in yet doesn't stop the daemon starting
+        assert daemon._SERVER is not None
+    finally:
+        daemon.stop()
+        thread.join(5)
+    assert sorted(logged_in) == ["first", "second"]
+
+
+def test_socket_is_owner_only(running_daemon):
+    assert os.stat(running_daemon).st_mode & 0o777 == 0o600
+
+
+def test_forward_runs_command(running_daemon, capsys):
+    add_service("local", enabled="0")
+    assert daemon.forward("enable", argparse.Namespace(NAME="local"), path=running_daemon)
+    assert config.get()["config.local"]["enabled"] == "1"
+
+    assert daemon.forward("create", argparse.Namespace(
+        title=None, description=None, announcement=None, game=None, gameid=None, lang=None, vod=True
+    ), path=running_daemon)
+    assert "local: rtmp://localhost/live" in capsys.readouterr().out
+
+
+def test_forward_error(running_daemon):
+    with pytest.raises(RuntimeError, match="No service named"):
+        daemon.forward("enable", argparse.Namespace(NAME="missing"), path=running_daemon)
+
+
+def test_forward_unknown_command(running_daemon):
+    with pytest.raises(RuntimeError, match="Unknown command"):
+        daemon.forward("runserver", argparse.Namespace(), path=running_daemon)
+
+
+def test_forward_timeout(config_dir):
+    path = os.path.join(str(config_dir), "d.sock")
+    # Accepts connections but never answers
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    try:
+        with pytest.raises(RuntimeError, match="--no-daemon"):
+            daemon.forward("enable", argparse.Namespace(NAME="x"), path=path, timeout=0.2)
+    finally:
+        server.close()
+
+
+def test_config_cache_sees_external_changes(config_dir):
+    add_service("local")
+    assert config.get()["config.local"]["enabled"] == "1"
+
+    # Another process rewrites the file
+    cfg = configparser.ConfigParser()
+    cfg.read(config.LOCAL_CONFIG_PATH)
+    cfg["config.local"]["enabled"] = "no"
+    with open(config.LOCAL_CONFIG_PATH, "w") as f:
+        cfg.write(f)
+    assert config.get()["config.local"]["enabled"] == "no"
+
+
+def test_registry_rebuilt_on_config_change(config_dir):
+    add_service("local")
+    first = services.get()
+    assert services.get() is first
+    assert [svc.name for svc in first.enabled] == ["local"]
+
+    # Same size as before, so only the generation counter tells them apart
+    cfg = config.get()
+    cfg["config.local"]["enabled"] = "0"
+    config.set(cfg)
+    second = services.get()
+    assert second is not first
+    assert second.enabled == []
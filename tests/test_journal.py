@@ -0,0 +1,135 @@
+import glob
+import json
+import os
+import time
+
+import pytest
+
+from mrstream import journal
+
+
+@pytest.fixture
+def journal_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal, "FLUSH_INTERVAL", 0.05)
+    return str(tmp_path)
+
+
+def test_close_flushes_pending_events(journal_dir):
+    j = journal.Journal(journal_dir)
+    for i in range(10):
+        j.append({"type": "follow", "username": f"u{i}"})
+    j.close()
+
+    assert [r["username"] for r in journal.query(path=journal_dir)] == [f"u{i}" for i in range(10)]
+    # Closing finishes the segment off
+    assert not glob.glob(os.path.join(journal_dir, "*.jsonl"))
+    assert len(glob.glob(os.path.join(journal_dir, "*.jsonl.gz"))) == 1
+
+
+def test_rotate_and_index(journal_dir, monkeypatch):
+    monkeypatch.setattr(journal, "SEGMENT_MAX_BYTES", 1)
+    monkeypatch.setattr(journal, "FLUSH_BATCH", 2)
+    j = journal.Journal(journal_dir)
+    for i in range(6):
+        j.append({"type": "raid" if i % 2 else "follow", "username": f"u{i}"})
+        # let each pair go out as its own batch
+        while i % 2 and j._pending:
+            time.sleep(0.01)
+    j.close()
+
+    indexes = []
+    for path in sorted(glob.glob(os.path.join(journal_dir, "events-*.idx.json"))):
+        with open(path) as f:
+            indexes.append(json.load(f))
+    assert len(indexes) > 1
+    assert sum(index["count"] for index in indexes) == 6
+    assert sum(index["types"].get("raid", 0) for index in indexes) == 3
+    for index in indexes:
+        assert index["start"] <= index["end"]
+
+
+def test_query_by_time_and_type(journal_dir, monkeypatch):
+    times = iter(range(100, 110))
+    monkeypatch.setattr(journal.time, "time", lambda: next(times, 200))
+    j = journal.Journal(journal_dir)
+    for i in range(6):
+        j.append({"type": "raid" if i % 2 else "follow", "username": f"u{i}"})
+    j.close()
+
+    found = journal.query(since=102, until=104, path=journal_dir)
+    assert [r["username"] for r in found] == ["u2", "u3", "u4"]
+    found = journal.query(types=["raid"], path=journal_dir)
+    assert [r["username"] for r in found] == ["u1", "u3", "u5"]
+    assert list(journal.query(since=300, path=journal_dir)) == []
+
+
+def test_recovery_rebuilds_stale_index(journal_dir):
+    segment = os.path.join(journal_dir, "events-0000000000001000.jsonl")
+    with open(segment, "w") as f:
+        for i in range(3):
+            f.write(json.dumps({"ts": 1 + i, "type": "follow", "username": f"u{i}"}) + "\n")
+        # a run that stopped partway through a line
+        f.write('{"ts": 4, "type": "fol')
+    # index written before the last batch
+    with open(os.path.join(journal_dir, "events-0000000000001000.idx.json"), "w") as f:
+        json.dump({"start": 1, "end": 1, "count": 1, "types": {"follow": 1}}, f)
+
+    journal.Journal(journal_dir).close()
+
+    assert os.path.exists(segment + ".gz") and not os.path.exists(segment)
+    assert [r["username"] for r in journal.query(since=2, path=journal_dir)] == ["u1", "u2"]
+
+
+def test_write_errors_are_retried(journal_dir, monkeypatch):
+    real_fsync = os.fsync
+    failures = [OSError(28, "No space left on device")]
+
+    def fsync(fd):
+        if failures:
+            raise failures.pop()
+        real_fsync(fd)
+
+    monkeypatch.setattr(journal.os, "fsync", fsync)
+    j = journal.Journal(journal_dir)
+    for i in range(3):
+        j.append({"type": "follow", "username": f"u{i}"})
+    for _ in range(100):
+        if not failures and not j._pending and not j._failing:
+            break
+        time.sleep(0.05)
+    assert j._thread.is_alive()
+    j.close()
+
+    # The failed batch is taken back out of the first segment and written again to a new one
+    assert [r["username"] for r in journal.query(path=journal_dir)] == ["u0", "u1", "u2"]
+    # and stays that way once the next run tidies up the first segment
+    journal.Journal(journal_dir).close()
+    assert [r["username"] for r in journal.query(path=journal_dir)] == ["u0", "u1", "u2"]
+
+
+def test_recovery_leaves_live_segments_alone(journal_dir):
+    first = journal.Journal(journal_dir)
+    first.append({"type": "follow", "username": "a"})
+    while first._pending or first._file is None:
+        time.sleep(0.01)
+
+    # e.g. a second runevents on another port, sharing the events directory
+    second = journal.Journal(journal_dir)
+    assert os.path.exists(first._segment)
+    first.append({"type": "follow", "username": "b"})
+    first.close()
+    second.close()
+
+    assert [r["username"] for r in journal.query(path=journal_dir)] == ["a", "b"]
+
+
+def test_oldest_events_dropped_past_max_pending(journal_dir, monkeypatch):
+    monkeypatch.setattr(journal, "MAX_PENDING", 3)
+    j = journal.Journal(journal_dir)
+    # Hold the writer off, as if the disk were stuck
+    with j._cond:
+        for i in range(5):
+            j.append({"type": "follow", "username": f"u{i}"})
+        assert [r["username"] for r in j._pending] == ["u2", "u3", "u4"]
+        assert j._dropped == 2
+    j.close()
@@ -0,0 +1,52 @@
+import argparse
+
+import pytest
+
+from mrstream import cli, config, services
+
+
+def test_service_must_implement_create_and_update():
+    class Partial(services.Service):
+        type = "partial"
+
+        def create(self, *args, **kwargs):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial("x", {})
+
+
+def test_unknown_type_warns_once(config_dir, capsys):
+    cfg = config.get()
+    cfg["config.mystery"] = {"type": "mystery"}
+    config.set(cfg)
+    assert "mystery" not in services.get().services
+
+    cfg = config.get()
+    cfg["config.other"] = {"type": "rtmp", "url": "rtmp://localhost/live"}
+    config.set(cfg)
+    assert "other" in services.get().services
+
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert captured.err.count("unknown service type") == 1
+
+
+def test_enable_disable_by_name(config_dir):
+    cli.add_rtmp(argparse.Namespace(NAME="box", URL="rtmp://localhost/live", STREAM_KEY=None))
+    cli.disable(argparse.Namespace(NAME="box"))
+    assert services.get().enabled == []
+    cli.enable(argparse.Namespace(NAME="box"))
+    assert [svc.name for svc in services.get().enabled] == ["box"]
+
+    with pytest.raises(ValueError):
+        cli.enable(argparse.Namespace(NAME="missing"))
+
+
+def test_peertube_update_without_stream_is_skipped(config_dir, capsys):
+    cfg = config.get()
+    cfg["config.tube"] = {"type": "peertube", "base_url": "https://example.com", "enabled": "1"}
+    config.set(cfg)
+    # Skipped without logging in, and without raising, so later services still get updated
+    services.get().services["tube"].update(title="New title")
+    assert "No stream to update on tube" in capsys.readouterr().out